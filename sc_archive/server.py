@@ -0,0 +1,300 @@
+import json
+import logging
+import mimetypes
+import os
+import pathlib
+import re
+import socket
+import urllib.parse
+from email.utils import formatdate
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from .config import init_config
+from .sql import init_sql, SQLArtist, SQLTrack
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+DEFAULT_TIMEOUT = 60
+MAX_BIGINT = 2**63 - 1
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_int(value: str) -> Optional[int]:
+    """
+    Parses a non-negative integer that fits in a BigInteger column,
+    returns None if the value is not one
+    """
+    if re.fullmatch(r"[0-9]+", value) is None:
+        return None
+    value = int(value)
+    if value > MAX_BIGINT:
+        return None
+    return value
+
+
+def make_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[tuple[int, int]]:
+    """
+    Parses a Range header into an inclusive (start, end) byte range.
+    Returns None if the header should be ignored (malformed or multiple
+    ranges), raises ValueError if the range cannot be satisfied
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: last n bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    end = int(end) if end else size - 1
+    return start, min(end, size - 1)
+
+
+class ArchiveRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "sc-archive"
+    # drop idle keep-alive and slow clients instead of holding a thread forever
+    timeout = DEFAULT_TIMEOUT
+
+    # set by make_server
+    Session: sessionmaker = None
+    data_path: pathlib.Path = None
+
+    def log_message(self, format: str, *args):
+        logger.info(f"{self.address_string()} - {format % args}")
+
+    def end_headers(self):
+        super().end_headers()
+        self.headers_sent = True
+
+    def send_json(self, data, status: HTTPStatus = HTTPStatus.OK):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def send_json_error(self, status: HTTPStatus, message: str = None):
+        self.send_json({"error": message or status.phrase}, status)
+
+    def get_page_params(self, query: dict) -> tuple[int, int]:
+        after = parse_int(query.get("after", ["0"])[0])
+        limit = parse_int(query.get("limit", [str(DEFAULT_PAGE_LIMIT)])[0])
+        if after is None or limit is None:
+            raise BadRequest("after and limit must be non-negative integers")
+        if limit < 1:
+            raise BadRequest("limit must be positive")
+        return after, min(limit, MAX_PAGE_LIMIT)
+
+    def list_page(self, q, model, query: dict) -> dict:
+        # keyset pagination on the primary key so each page is an index scan
+        # instead of an ever-growing OFFSET
+        after, limit = self.get_page_params(query)
+        deleted = query.get("deleted", [None])[0]
+        if deleted is not None:
+            if deleted not in ("0", "1"):
+                raise BadRequest("deleted must be 0 or 1")
+            if deleted == "1":
+                q = q.filter(model.deleted.isnot(None))
+            else:
+                q = q.filter(model.deleted.is_(None))
+        rows = q.filter(model.id > after).order_by(model.id).limit(limit + 1).all()
+        items = [row.to_dict() for row in rows[:limit]]
+        next_after = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next": next_after}
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self.headers_sent = False
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        try:
+            if not parts or parts[0] not in ("artists", "tracks") or len(parts) > 3:
+                return self.send_json_error(HTTPStatus.NOT_FOUND)
+            if len(parts) > 1:
+                item_id = parse_int(parts[1])
+                if item_id is None:
+                    return self.send_json_error(HTTPStatus.NOT_FOUND)
+            with self.Session() as session:
+                if parts == ["artists"]:
+                    self.send_json(
+                        self.list_page(session.query(SQLArtist), SQLArtist, query)
+                    )
+                elif len(parts) == 2 and parts[0] == "artists":
+                    artist = session.get(SQLArtist, item_id)
+                    if artist is None:
+                        return self.send_json_error(HTTPStatus.NOT_FOUND)
+                    self.send_json(artist.to_dict())
+                elif len(parts) == 3 and parts[0] == "artists" and parts[2] == "tracks":
+                    q = session.query(SQLTrack).filter(SQLTrack.user_id == item_id)
+                    self.send_json(self.list_page(q, SQLTrack, query))
+                elif parts == ["tracks"]:
+                    self.send_json(
+                        self.list_page(session.query(SQLTrack), SQLTrack, query)
+                    )
+                elif len(parts) == 2 and parts[0] == "tracks":
+                    track = session.get(SQLTrack, item_id)
+                    if track is None:
+                        return self.send_json_error(HTTPStatus.NOT_FOUND)
+                    self.send_json(track.to_dict())
+                elif len(parts) == 3 and parts[0] == "tracks" and parts[2] == "file":
+                    track = session.get(SQLTrack, item_id)
+                    if track is None or track.file_path is None:
+                        return self.send_json_error(HTTPStatus.NOT_FOUND)
+                    file_path = track.file_path
+                    # release the db connection before streaming the file
+                    session.close()
+                    self.send_track_file(file_path)
+                else:
+                    self.send_json_error(HTTPStatus.NOT_FOUND)
+        except BadRequest as ex:
+            self.send_json_error(HTTPStatus.BAD_REQUEST, str(ex))
+        except (BrokenPipeError, ConnectionResetError, TimeoutError, socket.timeout):
+            logger.info(f"{self.address_string()} - client disconnected")
+            self.close_connection = True
+        except Exception:
+            logger.exception("Could not handle request")
+            if self.headers_sent:
+                # the response is already partially written, so the only
+                # way to signal the failure is to drop the connection
+                self.close_connection = True
+            else:
+                self.send_json_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+
+    def send_track_file(self, file_path: str):
+        path = self.data_path.joinpath(file_path).resolve()
+        if self.data_path not in path.parents:
+            return self.send_json_error(HTTPStatus.NOT_FOUND)
+        try:
+            f = open(path, "rb")
+        except OSError:
+            return self.send_json_error(HTTPStatus.NOT_FOUND)
+        with f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size
+            etag = make_etag(stat)
+            last_modified = formatdate(stat.st_mtime, usegmt=True)
+            content_type = mimetypes.guess_type(path.name)[0]
+
+            if_none_match = self.headers.get("If-None-Match")
+            if if_none_match is not None:
+                # If-None-Match uses the weak comparison
+                tags = [t.strip() for t in if_none_match.split(",")]
+                tags = [t[2:] if t.startswith("W/") else t for t in tags]
+                if etag in tags or "*" in tags:
+                    self.send_response(HTTPStatus.NOT_MODIFIED)
+                    # no Content-Length: on a 304 it would have to match
+                    # the full 200 body, and the response has no body
+                    self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", last_modified)
+                    self.end_headers()
+                    return
+
+            byte_range = None
+            range_header = self.headers.get("Range")
+            if_range = self.headers.get("If-Range")
+            if range_header is not None and (if_range is None or if_range == etag):
+                try:
+                    byte_range = parse_range(range_header, size)
+                except ValueError:
+                    self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+            if byte_range is None:
+                offset, count = 0, size
+                self.send_response(HTTPStatus.OK)
+            else:
+                start, end = byte_range
+                offset, count = start, end - start + 1
+                self.send_response(HTTPStatus.PARTIAL_CONTENT)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            self.send_header("Content-Type", content_type or "application/octet-stream")
+            self.send_header("Content-Length", str(count))
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.send_header(
+                "Content-Disposition",
+                "inline; filename*=UTF-8''" + urllib.parse.quote(path.name),
+            )
+            self.end_headers()
+            if self.command != "HEAD" and count > 0:
+                # socket.sendfile uses os.sendfile where available, so the file
+                # is copied to the socket by the kernel without passing through
+                # userspace buffers
+                self.connection.sendfile(f, offset, count)
+
+
+def make_server(
+    host: str,
+    port: int,
+    Session: sessionmaker,
+    data_path: str,
+    timeout: float = DEFAULT_TIMEOUT,
+) -> ThreadingHTTPServer:
+    # a zero timeout would make the sockets non-blocking, which the handler
+    # and socket.sendfile do not support
+    if timeout <= 0:
+        raise ValueError(f"Server timeout must be positive, got {timeout}")
+    handler = type(
+        "ArchiveRequestHandler",
+        (ArchiveRequestHandler,),
+        {
+            "Session": Session,
+            "data_path": pathlib.Path(data_path).resolve(),
+            "timeout": timeout,
+        },
+    )
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def run():
+    logging.basicConfig()
+    config = init_config()
+    Session = init_sql(config.get("sql", "url"))
+    host = config.get("server", "host", fallback="0.0.0.0")
+    port = config.getint("server", "port", fallback=8080)
+    timeout = config.getfloat("server", "timeout", fallback=DEFAULT_TIMEOUT)
+    server = make_server(
+        host, port, Session, config.get("system", "data_path"), timeout
+    )
+    logger.info(f"Serving archive on {host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -14,5 +14,10 @@ setup(
         "sqlalchemy>=1.4.0,<2.0.0",
     ],
     python_requires=">=3.7",
-    entry_points={"console_scripts": ["sc-archive-run = sc_archive.archive:run"]},
+    entry_points={
+        "console_scripts": [
+            "sc-archive-run = sc_archive.archive:run",
+            "sc-archive-serve = sc_archive.server:run",
+        ]
+    },
 )
@@ -0,0 +1,264 @@
+import datetime
+import http.client
+import threading
+
+import json
+
+import pytest
+
+from sc_archive import server as server_module
+from sc_archive.server import make_server, parse_int, parse_range
+from sc_archive.sql import init_sql, SQLArtist, SQLTrack
+
+
+@pytest.mark.parametrize(
+    "header, size, expected",
+    [
+        ("bytes=0-", 1000, (0, 999)),
+        ("bytes=10-19", 1000, (10, 19)),
+        ("bytes=990-2000", 1000, (990, 999)),
+        ("bytes=-100", 1000, (900, 999)),
+        ("bytes=-2000", 1000, (0, 999)),
+        ("bytes=20-10", 1000, None),
+        ("bytes=0-1,5-6", 1000, None),
+        ("bytes=-", 1000, None),
+        ("items=0-1", 1000, None),
+    ],
+)
+def test_parse_range(header, size, expected):
+    assert parse_range(header, size) == expected
+
+
+@pytest.mark.parametrize(
+    "header, size",
+    [
+        ("bytes=1000-", 1000),
+        ("bytes=5000-6000", 1000),
+        ("bytes=-0", 1000),
+        ("bytes=0-", 0),
+        ("bytes=-10", 0),
+    ],
+)
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("0", 0),
+        ("123", 123),
+        (str(2**63 - 1), 2**63 - 1),
+        (str(2**63), None),
+        ("\xb2", None),
+        ("1_000", None),
+        (" 1", None),
+        ("-1", None),
+        ("", None),
+    ],
+)
+def test_parse_int(value, expected):
+    assert parse_int(value) == expected
+
+
+@pytest.fixture
+def server(tmp_path):
+    data_path = tmp_path / "data"
+    data_path.joinpath("1").mkdir(parents=True)
+    data_path.joinpath("1", "1_0_track.flac").write_bytes(bytes(range(250)) * 4)
+    tmp_path.joinpath("outside.flac").write_bytes(b"secret")
+
+    Session = init_sql(f"sqlite:///{tmp_path / 'archive.db'}")
+    with Session() as session:
+        for artist_id in (1, 2):
+            session.add(
+                SQLArtist(
+                    id=artist_id,
+                    last_modified=datetime.datetime(2024, 1, 1),
+                    permalink_url=f"https://soundcloud.com/{artist_id}",
+                    username=f"artist {artist_id}",
+                )
+            )
+        session.commit()
+        for track_id, user_id, file_path, deleted in [
+            (1, 1, "1/1_0_track.flac", None),
+            (2, 1, "../outside.flac", None),
+            (3, 2, None, datetime.datetime(2024, 2, 1)),
+            (4, 1, None, None),
+        ]:
+            session.add(
+                SQLTrack(
+                    id=track_id,
+                    user_id=user_id,
+                    full_duration=1,
+                    last_modified=datetime.datetime(2024, 1, 1),
+                    permalink_url="https://soundcloud.com/a/b",
+                    title="track",
+                    downloadable=False,
+                    file_path=file_path,
+                    deleted=deleted,
+                )
+            )
+        session.commit()
+
+    server = make_server("127.0.0.1", 0, Session, str(data_path), timeout=5)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def request(
+    server, path: str, headers: dict = None, method: str = "GET"
+) -> http.client.HTTPResponse:
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    conn.request(method, path, headers=headers or {})
+    response = conn.getresponse()
+    response.body = response.read()
+    conn.close()
+    return response
+
+
+def get_json(server, path: str):
+    response = request(server, path)
+    assert response.status == 200
+    assert response.headers["Content-Type"] == "application/json"
+    return json.loads(response.body)
+
+
+def test_get_artist(server):
+    artist = get_json(server, "/artists/1")
+    assert artist["id"] == 1
+    assert artist["username"] == "artist 1"
+    assert artist["last_modified"] == int(datetime.datetime(2024, 1, 1).timestamp())
+    assert request(server, "/artists/3").status == 404
+
+
+def test_get_track(server):
+    track = get_json(server, "/tracks/3")
+    assert track["id"] == 3
+    assert track["user_id"] == 2
+    assert track["deleted"] == int(datetime.datetime(2024, 2, 1).timestamp())
+    assert request(server, "/tracks/5").status == 404
+    assert request(server, "/tracks/4/file").status == 404
+
+
+def test_list_pages(server):
+    ids = []
+    after = 0
+    while True:
+        page = get_json(server, f"/tracks?limit=3&after={after}")
+        ids += [track["id"] for track in page["items"]]
+        if page["next"] is None:
+            break
+        assert page["next"] == page["items"][-1]["id"]
+        after = page["next"]
+    assert ids == [1, 2, 3, 4]
+
+    page = get_json(server, "/tracks?limit=4")
+    assert [track["id"] for track in page["items"]] == [1, 2, 3, 4]
+    assert page["next"] is None
+
+    page = get_json(server, "/artists")
+    assert [artist["id"] for artist in page["items"]] == [1, 2]
+    assert page["next"] is None
+
+
+def test_list_artist_tracks(server):
+    page = get_json(server, "/artists/1/tracks?limit=2")
+    assert [track["id"] for track in page["items"]] == [1, 2]
+    assert page["next"] == 2
+    page = get_json(server, "/artists/1/tracks?limit=2&after=2")
+    assert [track["id"] for track in page["items"]] == [4]
+    assert page["next"] is None
+    assert get_json(server, "/artists/3/tracks") == {"items": [], "next": None}
+
+
+def test_list_deleted_filter(server):
+    page = get_json(server, "/tracks?deleted=1")
+    assert [track["id"] for track in page["items"]] == [3]
+    page = get_json(server, "/tracks?deleted=0")
+    assert [track["id"] for track in page["items"]] == [1, 2, 4]
+    assert request(server, "/tracks?deleted=yes").status == 400
+
+
+def test_list_limit_clamped(server, monkeypatch):
+    monkeypatch.setattr(server_module, "MAX_PAGE_LIMIT", 2)
+    page = get_json(server, "/tracks?limit=1000")
+    assert [track["id"] for track in page["items"]] == [1, 2]
+    assert page["next"] == 2
+
+
+def test_head(server):
+    response = request(server, "/tracks/1/file", method="HEAD")
+    assert response.status == 200
+    assert response.headers["Content-Length"] == "1000"
+    assert response.body == b""
+
+    response = request(server, "/tracks", method="HEAD")
+    assert response.status == 200
+    assert int(response.headers["Content-Length"]) > 0
+    assert response.body == b""
+
+
+def test_range_request(server):
+    response = request(server, "/tracks/1/file", {"Range": "bytes=10-19"})
+    assert response.status == 206
+    assert response.headers["Content-Range"] == "bytes 10-19/1000"
+    assert response.body == bytes(range(10, 20))
+
+
+def test_range_not_satisfiable(server):
+    response = request(server, "/tracks/1/file", {"Range": "bytes=1000-"})
+    assert response.status == 416
+    assert response.headers["Content-Range"] == "bytes */1000"
+
+
+def test_etag(server):
+    full = request(server, "/tracks/1/file")
+    etag = full.headers["ETag"]
+    response = request(server, "/tracks/1/file", {"If-None-Match": etag})
+    assert response.status == 304
+    assert response.headers["ETag"] == etag
+    assert response.headers["Last-Modified"] == full.headers["Last-Modified"]
+    assert "Content-Length" not in response.headers
+    assert response.body == b""
+    weak = request(server, "/tracks/1/file", {"If-None-Match": f"W/{etag}"})
+    assert weak.status == 304
+
+    # If-Range uses the strong comparison
+    headers = {"Range": "bytes=0-9", "If-Range": f"W/{etag}"}
+    assert request(server, "/tracks/1/file", headers).status == 200
+    headers = {"Range": "bytes=0-9", "If-Range": etag}
+    assert request(server, "/tracks/1/file", headers).status == 206
+
+
+def test_path_outside_data_path(server):
+    response = request(server, "/tracks/2/file")
+    assert response.status == 404
+    assert b"secret" not in response.body
+
+
+@pytest.mark.parametrize(
+    "path, status",
+    [
+        ("/tracks/%C2%B2", 404),
+        ("/tracks/99999999999999999999999", 404),
+        ("/tracks/-1", 404),
+        ("/foo/bar", 404),
+        ("/tracks?after=99999999999999999999999", 400),
+        ("/tracks?limit=0", 400),
+        ("/tracks?limit=abc", 400),
+    ],
+)
+def test_invalid_input(server, path, status):
+    assert request(server, path).status == status
+
+
+@pytest.mark.parametrize("timeout", [0, -1])
+def test_invalid_timeout(tmp_path, timeout):
+    Session = init_sql(f"sqlite:///{tmp_path / 'archive.db'}")
+    with pytest.raises(ValueError):
+        make_server("127.0.0.1", 0, Session, str(tmp_path), timeout=timeout)